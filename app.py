@@ -1,6 +1,15 @@
 import streamlit as st
 import pandas as pd
-import io
+import numpy as np
+import itertools
+import hashlib
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from rustpy_xlsxwriter import FastExcel
+except ImportError:
+    FastExcel = None
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -23,25 +32,145 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # --- HELPER FUNCTIONS ---
-def normalize_match_type(val):
-    if pd.isna(val): return 'UNKNOWN'
-    val = str(val).upper()
-    if 'EXACT' in val: return 'EXACT'
-    if 'PHRASE' in val: return 'PHRASE'
-    if 'BROAD' in val: return 'BROAD'
-    return 'AUTO/OTHER'
-
-def generate_ngrams(text, n):
-    words = str(text).lower().split()
-    if len(words) < n: return []
-    return [' '.join(words[i:i+n]) for i in range(len(words)-n+1)]
+COLUMN_PATTERNS = {
+    'term': (('Customer Search Term', 'Matched product'), 'Search Term'),
+    'camp': (('Campaign Name',), 'Campaign'),
+    'adg': (('Ad Group Name',), 'Ad Group'),
+    'match': (('Match Type',), 'Match Type'),
+    'spend': (('Spend',), 'Spend'),
+    'sales': (('Sales',), 'Sales'),
+    'orders': (('Orders',), 'Orders'),
+    'clicks': (('Clicks',), 'Clicks')
+}
+
+GRAM_SIZES = [1, 2, 3, 4]
+
+MATCH_TYPES = ['EXACT', 'PHRASE', 'BROAD', 'AUTO/OTHER', 'UNKNOWN']
+
+def normalize_match_type(series):
+    # Classify the few distinct values, then map category codes back per row
+    codes, uniq = pd.factorize(series)
+    vals = pd.Series(uniq).astype(str).str.upper()
+    conds = [vals.str.contains(mt, regex=False).to_numpy(dtype=bool) for mt in MATCH_TYPES[:3]]
+    lookup = np.append(np.select(conds, [0, 1, 2], default=3), 4)  # missing values (code -1) -> UNKNOWN
+    return pd.Categorical.from_codes(lookup[codes], categories=MATCH_TYPES)
+
+def safe_divide(num, den):
+    num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+def tokenize_terms(df):
+    # Lower/split each distinct term once, then expand token ids back to rows
+    codes, terms = pd.factorize(df['Search Term'])
+    tokens = pd.Series(terms).astype(str).str.lower().str.split()
+    term_lengths = tokens.str.len().to_numpy(dtype=np.int64)
+    flat = np.fromiter(itertools.chain.from_iterable(tokens), dtype=object, count=term_lengths.sum())
+    term_ids, vocab = pd.factorize(flat)
+    term_lengths = np.append(term_lengths, 0)  # missing terms (code -1) have no tokens
+    lengths = term_lengths[codes]
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    ids = term_ids[np.repeat((np.cumsum(term_lengths) - term_lengths)[codes], lengths) + offsets]
+    return ids, np.asarray(vocab, dtype=object), lengths
+
+def build_ngrams(df, n, tokens):
+    ids, vocab, lengths = tokens
+    row_idx = np.repeat(np.arange(len(lengths)), lengths)
+    pos = np.arange(len(ids)) - (np.cumsum(lengths) - lengths)[row_idx]
+    keep = pos <= (lengths - n)[row_idx]
+    row_idx = row_idx[keep]
+    keys = ids[np.flatnonzero(keep)[:, None] + np.arange(n)]
+    # Group on token ids; pack each n-tuple into one int64 key when it fits
+    if len(vocab) ** n < 2 ** 63:
+        inverse, _ = pd.factorize(keys @ (len(vocab) ** np.arange(n, dtype=np.int64)))
+        uniq = np.empty((inverse.max() + 1 if len(inverse) else 0, n), dtype=np.int64)
+        uniq[inverse] = keys
+    else:
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+    ng_df = pd.DataFrame({'N-Gram': list(map(' '.join, zip(*(vocab[uniq[:, k]].tolist() for k in range(n)))))})
+    for col in ['Spend', 'Sales', 'Orders']:
+        sums = np.bincount(inverse, weights=df[col].to_numpy(dtype=float)[row_idx], minlength=len(uniq))
+        ng_df[col] = sums.astype(df[col].dtype)
+    ng_df['Count'] = np.bincount(inverse, minlength=len(uniq))
+    ng_df['ACOS'] = safe_divide(ng_df['Spend'] * 100, ng_df['Sales']).round(1)
+    return ng_df.sort_values(by='Spend', ascending=False)
+
+@st.cache_resource(show_spinner=False)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=2)
+
+def finished_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def prebuild_ngrams(digest, _df, _first=GRAM_SIZES[0]):
+    # Build the selected size on the script thread; only the rest go to the shared pool
+    tokens = tokenize_terms(_df)
+    futures = {_first: finished_future(build_ngrams(_df, _first, tokens))}
+    futures.update({n: get_executor().submit(build_ngrams, _df, n, tokens) for n in GRAM_SIZES if n != _first})
+    return tokens, futures
+
+def get_ngrams(digest, df, n):
+    tokens, futures = prebuild_ngrams(digest, df, n)
+    future = futures[n]
+    # Build inline if the background job is still queued (possibly behind other sessions) or failed
+    if future.cancel() or future.cancelled() or (future.done() and future.exception() is not None):
+        futures[n] = future = finished_future(build_ngrams(df, n, tokens))
+    return future.result()
+
+@st.cache_data(show_spinner=False)
+def load_report(name, digest, _file):
+    if name.endswith('.csv'): df_raw = pd.read_csv(_file, engine='pyarrow')
+    else: df_raw = pd.read_excel(_file, engine='calamine')
+    df_raw.columns = df_raw.columns.str.strip()
+    return df_raw
+
+@st.cache_data(show_spinner=False)
+def detect_columns(columns):
+    return {
+        key: next((c for c in columns if any(p in c for p in needles)), default)
+        for key, (needles, default) in COLUMN_PATTERNS.items()
+    }
+
+@st.cache_data(show_spinner=False)
+def summarize_terms(digest, _df):
+    df = _df.copy()
+    col_map = detect_columns(tuple(df.columns))
+    num_cols = list(dict.fromkeys(col_map[key] for key in ['spend', 'sales', 'orders', 'clicks']))
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce').fillna(0)
+    df['norm_match'] = normalize_match_type(df[col_map['match']])
+    key_cols = list(dict.fromkeys(col_map[key] for key in ['term', 'camp', 'adg']))
+    df[key_cols] = df[key_cols].astype('category')
+
+    # Aggregation including Campaign/AdGroup for Wasted Spend
+    df_agg = df.groupby([col_map['term'], col_map['camp'], col_map['adg'], 'norm_match'], as_index=False, observed=True)[num_cols].sum().rename(columns={
+        col_map['term']: 'Search Term', col_map['camp']: 'Campaign', col_map['adg']: 'Ad Group',
+        col_map['spend']: 'Spend', col_map['sales']: 'Sales', col_map['orders']: 'Orders', col_map['clicks']: 'Clicks'
+    })
+    
+    df_agg['ACOS'] = safe_divide(df_agg['Spend'] * 100, df_agg['Sales']).round(1)
+    df_agg['ROAS'] = safe_divide(df_agg['Sales'], df_agg['Spend']).round(1)
+    return df_agg
 
 def to_excel(dfs):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet_name, df in dfs.items():
-            if not df.empty: df.to_excel(writer, sheet_name=sheet_name[:31], index=False) 
-    return output.getvalue()
+    # Keep small workbooks in memory, spill large ones to disk while writing
+    sheets = {sheet_name[:31]: df for sheet_name, df in dfs.items() if not df.empty}
+    with tempfile.SpooledTemporaryFile(max_size=64 << 20, mode='w+b') as output:
+        # FastExcel refuses to save a workbook without sheets; xlsxwriter writes a blank one
+        if FastExcel is not None and sheets:
+            writer = FastExcel(output)
+            for sheet_name, df in sheets.items():
+                cat_cols = df.select_dtypes('category').columns
+                writer.sheet(sheet_name, df.astype(dict.fromkeys(cat_cols, object)))
+            writer.save()
+        else:
+            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+                for sheet_name, df in sheets.items():
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+        output.seek(0)
+        return output.read()
 
 # --- MAIN APP ---
 def main():
@@ -53,10 +182,8 @@ def main():
         df = None
         if uploaded_file:
             try:
-                if uploaded_file.name.endswith('.csv'): df_raw = pd.read_csv(uploaded_file)
-                else: df_raw = pd.read_excel(uploaded_file, engine='openpyxl')
-                df_raw.columns = df_raw.columns.str.strip()
-                df = df_raw.copy()
+                digest = hashlib.md5(uploaded_file.getbuffer()).hexdigest()
+                df = load_report(uploaded_file.name, digest, uploaded_file)
             except Exception as e: st.error(f"Error: {e}")
 
         if df is not None:
@@ -66,32 +193,7 @@ def main():
 
     if df is not None:
         try:
-            # Column Mapping
-            col_map = {
-                'term': next((c for c in df.columns if 'Customer Search Term' in c or 'Matched product' in c), 'Search Term'),
-                'camp': next((c for c in df.columns if 'Campaign Name' in c), 'Campaign'),
-                'adg': next((c for c in df.columns if 'Ad Group Name' in c), 'Ad Group'),
-                'match': next((c for c in df.columns if 'Match Type' in c), 'Match Type'),
-                'spend': next((c for c in df.columns if 'Spend' in c), 'Spend'),
-                'sales': next((c for c in df.columns if 'Sales' in c), 'Sales'),
-                'orders': next((c for c in df.columns if 'Orders' in c), 'Orders'),
-                'clicks': next((c for c in df.columns if 'Clicks' in c), 'Clicks')
-            }
-            
-            for key in ['spend', 'sales', 'orders', 'clicks']:
-                df[col_map[key]] = pd.to_numeric(df[col_map[key]], errors='coerce').fillna(0)
-            df['norm_match'] = df[col_map['match']].apply(normalize_match_type)
-
-            # Aggregation including Campaign/AdGroup for Wasted Spend
-            df_agg = df.groupby([col_map['term'], col_map['camp'], col_map['adg'], 'norm_match'], as_index=False).agg({
-                col_map['spend']: 'sum', col_map['sales']: 'sum', col_map['orders']: 'sum', col_map['clicks']: 'sum'
-            }).rename(columns={
-                col_map['term']: 'Search Term', col_map['camp']: 'Campaign', col_map['adg']: 'Ad Group',
-                col_map['spend']: 'Spend', col_map['sales']: 'Sales', col_map['orders']: 'Orders', col_map['clicks']: 'Clicks'
-            })
-            
-            df_agg['ACOS'] = (df_agg['Spend'] / df_agg['Sales'] * 100).fillna(0).round(1)
-            df_agg['ROAS'] = (df_agg['Sales'] / df_agg['Spend']).fillna(0).round(1)
+            df_agg = summarize_terms(digest, df)
 
             # --- TABS ---
             st.title("Prabal Ecommerce Analyzer")
@@ -122,16 +224,10 @@ def main():
                         st.dataframe(mt_df[(mt_df['Sales'] > 0) & (mt_df['ACOS'] <= acos_limit)].nsmallest(10, 'ACOS')[['Search Term', 'Sales', 'ACOS', 'Orders']], use_container_width=True)
 
             with tabs[2]:
-                n_val = st.radio("Gram Size", [1, 2, 3, 4], horizontal=True)
-                ngram_data = []
-                for _, row in df_agg.iterrows():
-                    grams = generate_ngrams(row['Search Term'], n_val)
-                    for g in grams:
-                        ngram_data.append({'N-Gram': g, 'Spend': row['Spend'], 'Sales': row['Sales'], 'Orders': row['Orders']})
-                if ngram_data:
-                    ng_df = pd.DataFrame(ngram_data).groupby('N-Gram', as_index=False).sum()
-                    ng_df['ACOS'] = (ng_df['Spend'] / ng_df['Sales'] * 100).fillna(0).round(1)
-                    st.dataframe(ng_df.sort_values(by='Spend', ascending=False), use_container_width=True)
+                n_val = st.radio("Gram Size", GRAM_SIZES, horizontal=True)
+                ng_df = get_ngrams(digest, df_agg, n_val)
+                if not ng_df.empty:
+                    st.dataframe(ng_df, use_container_width=True)
 
             with tabs[3]:
                 st.subheader("💸 Wasted Spend (Zero Orders)")
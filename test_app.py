@@ -0,0 +1,18 @@
+import io
+
+import pandas as pd
+
+from app import to_excel
+
+
+def test_to_excel_empty_summary_still_writes_workbook():
+    empty = pd.DataFrame(columns=['Search Term', 'Spend', 'Sales'])
+    data = to_excel({"Summary": empty})
+    assert data
+    assert pd.read_excel(io.BytesIO(data), sheet_name=None)
+
+
+def test_to_excel_writes_categorical_columns():
+    df = pd.DataFrame({'Search Term': pd.Categorical(['red shoe', 'blue shoe']), 'Spend': [1.5, 2.0]})
+    sheets = pd.read_excel(io.BytesIO(to_excel({"Summary": df})), sheet_name=None)
+    assert sheets['Summary']['Search Term'].tolist() == ['red shoe', 'blue shoe']